@@ -5,6 +5,9 @@ logging.basicConfig(level=logging.INFO)
 
 import re
 import json
+import time
+import threading
+from urllib.parse import urlparse
 
 import requests
 from bs4 import BeautifulSoup
@@ -21,6 +24,178 @@ bill_votedata_base = 'http://likms.assembly.go.kr/bill/billVoteResultDetail.do'
 bill_summdata_base = 'http://likms.assembly.go.kr/bill/billDetail2.do'
 bill_list_ajax_base = 'http://likms.assembly.go.kr/bill/billVoteResultListAjax.do'
 
+# Request pacing
+#
+# The National Assembly servers slow down and start returning errors under
+# load, so every request goes through rate_controller. For each host it
+# limits the number of requests in flight and the request rate. Both limits
+# grow additively after each fast, successful request, and are cut
+# multiplicatively after an error, a timeout, or a slow response (AIMD).
+# After too many consecutive failures the circuit breaker opens, and requests
+# to that host pause for a cooldown, which doubles on each repeated trip. Once
+# a host has used up its total pause budget, requests made while its circuit
+# is open fail immediately with CircuitOpenError instead, so that a run against
+# a site that stays down still finishes (recording the failures as usual).
+
+request_timeout = 60 # seconds
+request_max_attempts = 4 # per scraper request, including retries of errors/timeouts
+
+# request errors worth retrying; ChunkedEncodingError is a truncated response,
+# which is common when the server is overloaded
+request_retry_exceptions = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised instead of waiting when a host's circuit breaker is open and its
+    pause budget is used up."""
+
+class HostRateState:
+    """Pacing state for a single host."""
+
+    def __init__(self, controller):
+        self.max_in_flight = 1.0 # float so that it can grow additively by fractions
+        self.in_flight = 0
+        self.rate = controller.initial_rate # requests per second
+        self.next_start_time = 0.0
+        self.consecutive_failures = 0
+        self.circuit_open_until = 0.0
+        self.circuit_cooldown = controller.circuit_cooldown
+        self.total_paused = 0.0 # seconds spent waiting for the circuit to close
+
+class RateController:
+    """Per-host AIMD request pacing with a circuit breaker.
+
+    Usage:
+        controller.acquire(host)  # blocks until the request may start
+        ... make request ...
+        controller.release(host, latency, success)  # always, even if the request raised
+    """
+
+    def __init__(self,
+            initial_rate:float = 2.0,           # requests per second
+            min_rate:float = 0.1,
+            max_rate:float = 20.0,
+            rate_increase:float = 0.1,          # added to rate per good request
+            max_in_flight:int = 8,
+            decrease_factor:float = 0.5,        # rate and in-flight multiplier on a bad request
+            slow_latency:float = 10.0,          # seconds; slower responses count as bad
+            circuit_threshold:int = 5,          # consecutive failures to open the circuit
+            circuit_cooldown:float = 60.0,      # seconds; doubles on each repeated trip
+            max_circuit_cooldown:float = 900.0,
+            max_total_pause:float = 1800.0,     # seconds per host; then fail fast while open
+            ):
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate_increase = rate_increase
+        self.max_in_flight = max_in_flight
+        self.decrease_factor = decrease_factor
+        self.slow_latency = slow_latency
+        self.circuit_threshold = circuit_threshold
+        self.circuit_cooldown = circuit_cooldown
+        self.max_circuit_cooldown = max_circuit_cooldown
+        self.max_total_pause = max_total_pause
+
+        self.condition = threading.Condition()
+        self.hosts = {}
+
+    def _host_state(self, host:str) -> HostRateState:
+        if host not in self.hosts:
+            self.hosts[host] = HostRateState(self)
+        return self.hosts[host]
+
+    def acquire(self, host:str):
+        """Block until a request to host may start.
+
+        Raises CircuitOpenError if the host's circuit is open and waiting for
+        it would exceed the host's pause budget.
+        """
+        with self.condition:
+            state = self._host_state(host)
+            while True:
+                curtime = time.monotonic()
+                if curtime < state.circuit_open_until:
+                    wait_time = state.circuit_open_until - curtime
+                    if state.total_paused + wait_time > self.max_total_pause:
+                        raise CircuitOpenError("{} is unavailable (circuit breaker open)".format(host))
+                    self.condition.wait(wait_time)
+                    state.total_paused += time.monotonic() - curtime
+                    continue
+                if state.in_flight >= int(state.max_in_flight):
+                    wait_time = None # until a release
+                elif curtime < state.next_start_time:
+                    wait_time = state.next_start_time - curtime
+                else:
+                    break
+                self.condition.wait(wait_time)
+
+            state.in_flight += 1
+            state.next_start_time = curtime + 1.0 / state.rate
+
+    def release(self, host:str, latency:float, success:bool):
+        """Record the outcome of a request to host, and adjust its limits."""
+        with self.condition:
+            state = self._host_state(host)
+            state.in_flight -= 1
+
+            if success and latency <= self.slow_latency:
+                # additive increase; in-flight grows by about 1 per window of requests
+                state.rate = min(self.max_rate, state.rate + self.rate_increase)
+                state.max_in_flight = min(self.max_in_flight, state.max_in_flight + 1.0 / state.max_in_flight)
+            else:
+                # multiplicative decrease
+                state.rate = max(self.min_rate, state.rate * self.decrease_factor)
+                state.max_in_flight = max(1.0, state.max_in_flight * self.decrease_factor)
+                state.next_start_time = max(state.next_start_time, time.monotonic() + 1.0 / state.rate)
+
+            if success:
+                state.consecutive_failures = 0
+                state.circuit_cooldown = self.circuit_cooldown
+            else:
+                state.consecutive_failures += 1
+                if state.consecutive_failures >= self.circuit_threshold:
+                    logging.warning("{} failed {} times in a row; pausing requests for {} seconds.".format(
+                        host, state.consecutive_failures, state.circuit_cooldown))
+                    state.circuit_open_until = time.monotonic() + state.circuit_cooldown
+                    state.circuit_cooldown = min(self.max_circuit_cooldown, state.circuit_cooldown * 2)
+                    # after the cooldown, let a single trial request through
+                    state.consecutive_failures = self.circuit_threshold - 1
+
+            self.condition.notify_all()
+
+rate_controller = RateController()
+
+def post(url:str, data:dict) -> requests.Response:
+    """POST data to url, paced by rate_controller.
+
+    Connection errors, timeouts, truncated responses, and server errors (5xx,
+    429) are retried up to request_max_attempts times in total, and then
+    raised. Any other exception is counted as a failure and raised at once, as
+    is CircuitOpenError.
+    """
+    host = urlparse(url).netloc
+    for attempt in range(1, request_max_attempts + 1):
+        rate_controller.acquire(host)
+        start_time = time.monotonic()
+        response = None
+        try:
+            response = requests.post(url, data=data, timeout=request_timeout)
+        except request_retry_exceptions as err:
+            if attempt == request_max_attempts:
+                raise
+            logging.info("Request to {} failed ({}); retrying.".format(url, type(err).__name__))
+            continue
+        finally:
+            # every acquire() needs a release(), or the host's in-flight slot leaks
+            success = (response is not None) and not (response.status_code >= 500 or response.status_code == 429)
+            rate_controller.release(host, time.monotonic() - start_time, success)
+
+        if success:
+            return response
+        if attempt == request_max_attempts:
+            response.raise_for_status()
+        logging.info("Request to {} returned {}; retrying.".format(url, response.status_code))
+
+
 def scrape_member_list(session: int) -> dict:
     """Given a session (e.g., 21), return a list of Assembly member names and ids.
 
@@ -29,7 +204,7 @@ def scrape_member_list(session: int) -> dict:
 
     # Get member list page
     logging.info("Downloading member list #" + str(session) + "...")
-    website_html = requests.post(member_list_base, data={
+    website_html = post(member_list_base, data={
         'ageFrom':  session,
         'ageTo':    session,
         'age':      session,
@@ -119,7 +294,7 @@ def scrape_bill_list_data(session:int) -> dict:
 
     # get bill list data
     logging.info("Downloading bill list #" + str(session) + "...")
-    bill_list_json = requests.post(bill_list_ajax_base, data={
+    bill_list_json = post(bill_list_ajax_base, data={
         'ageFrom': session,
         'ageTo': session,
         'age': session,
@@ -165,7 +340,7 @@ def scrape_member_data(member_id:str, session:int) -> dict:
 
     #website_html = requests.get('{}?dept_cd={}'.format(member_curdata_base, member_id)).text # only for current members of the assembly
 
-    website_html = requests.post(member_data_base, data={
+    website_html = post(member_data_base, data={
         'ageFrom':  session,
         'ageTo':    session,
         'age':      session,
@@ -173,7 +348,7 @@ def scrape_member_data(member_id:str, session:int) -> dict:
         }).text
     soup = BeautifulSoup(website_html,'lxml')
 
-    website_html2 = requests.post(member_curdata_base, data={
+    website_html2 = post(member_curdata_base, data={
         'dept_cd':member_id,
         }).text
     soup2 = BeautifulSoup(website_html2,'lxml')
@@ -336,7 +511,7 @@ def scrape_bill_data(bill_no:str, bill_id:str, id_master:int, session:int) -> di
     # Get bill vote data page
     logging.info("Downloading bill vote data #" + bill_id + "...")
 
-    website_html = requests.post(bill_votedata_base, data={
+    website_html = post(bill_votedata_base, data={
         'age':      session,
         'billNo':   bill_no,
         'billId':   bill_id,
@@ -417,7 +592,7 @@ def scrape_bill_data(bill_no:str, bill_id:str, id_master:int, session:int) -> di
 
     # Get bill summary data page
     logging.info("Downloading bill summary data #" + bill_id + "...")
-    summ_website_html = requests.post(bill_summdata_base, data={
+    summ_website_html = post(bill_summdata_base, data={
         'billId':   bill_id,
         }).text
     summ_soup = BeautifulSoup(summ_website_html,'lxml').find('div', {'class': 'subContents'})
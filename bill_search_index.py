@@ -0,0 +1,243 @@
+#! /usr/bin/python
+
+import logging
+logging.basicConfig(level=logging.INFO)
+
+import os
+import re
+import json
+import argparse
+import math
+import unicodedata
+
+
+# Full-text search over bill names and summaries.
+#
+# Korean bill names are mostly long compounds (e.g. '국민건강보험법일부개정법률안'
+# vs. '국민건강보험법 일부개정법률안'), so splitting on whitespace is not enough.
+# Instead text is broken into character bigrams within each run of word
+# characters. Single characters are indexed too, so that one-syllable queries
+# (e.g. '법') match. Results are ranked with BM25, with bill name matches
+# weighted above summary matches.
+#
+# The index is persisted as JSON, and is updated one bill at a time, so the
+# scraper only needs to add the bills it saves in each run. It is large and
+# entirely derived from bills/, so it is kept in a cache dir rather than in the
+# (committed) data dir.
+
+bill_search_index_filename = 'bill_search_index.json'
+bill_search_index_version = 2
+
+default_data_dir = '../data'
+default_cache_dir = '../cache'
+
+bill_data_filename_regex = re.compile('bill_data_session([2-9][0-9])_no([^_]*)_id(.*).json')
+
+ngram_size = 2
+name_weight = 3 # each gram in a bill name counts this many times
+
+# BM25 parameters
+bm25_k1 = 1.2
+bm25_b = 0.75
+
+word_run_regex = re.compile(r'\w+')
+
+
+def tokenize(text: str, unigrams: bool = True) -> list:
+    """Return the list of character n-grams in text.
+
+    Text is NFKC-normalized and lowercased, then split into runs of word
+    characters. Runs shorter than ngram_size are kept whole. If unigrams is
+    True, every single character of longer runs is included as well; bills
+    are indexed with unigrams, while queries only use them for short runs.
+    """
+    if not text:
+        return []
+
+    text = unicodedata.normalize('NFKC', text).lower()
+    grams = []
+    for run in word_run_regex.findall(text):
+        if len(run) <= ngram_size:
+            grams.append(run)
+            if unigrams and len(run) > 1:
+                grams.extend(run)
+        else:
+            grams.extend(run[i:i+ngram_size] for i in range(len(run) - ngram_size + 1))
+            if unigrams:
+                grams.extend(run)
+    return grams
+
+
+class BillSearchIndex:
+    """Inverted index from character n-grams to bills.
+
+    Data layout (also the persisted JSON layout):
+        postings:     gram -> {bill_id: weighted term frequency}
+        docs:         bill_id -> {'session': session, 'length': weighted # of grams}
+        total_length: sum of all doc lengths (for BM25 length normalization)
+    """
+
+    def __init__(self):
+        self.postings = {}
+        self.docs = {}
+        self.total_length = 0
+
+    ##### Updating
+
+    def add_bill(self, bill_data: dict):
+        """Add or replace a bill, using its name and summary."""
+        bill_id = bill_data['bill_id']
+        self.remove_bill(bill_id)
+
+        term_freqs = {}
+        for gram in tokenize(bill_data.get('name')):
+            term_freqs[gram] = term_freqs.get(gram, 0) + name_weight
+        for gram in tokenize(bill_data.get('summary')):
+            term_freqs[gram] = term_freqs.get(gram, 0) + 1
+
+        for gram, tf in term_freqs.items():
+            self.postings.setdefault(gram, {})[bill_id] = tf
+
+        doc_length = sum(term_freqs.values())
+        self.docs[bill_id] = {
+            'session': bill_data.get('session'),
+            'length':  doc_length,
+            }
+        self.total_length += doc_length
+
+    def remove_bill(self, bill_id: str):
+        """Remove a bill. This scans all postings, but bills are rarely removed."""
+        doc = self.docs.pop(bill_id, None)
+        if doc is None:
+            return
+
+        for gram in list(self.postings):
+            gram_postings = self.postings[gram]
+            if bill_id in gram_postings:
+                del(gram_postings[bill_id])
+                if len(gram_postings) == 0:
+                    del(self.postings[gram])
+        self.total_length -= doc['length']
+
+    def update_from_bill_dir(self, bill_data_dir: str) -> int:
+        """Add any bill files in bill_data_dir that are not yet indexed.
+
+        Bill ids are read from the filenames, so already-indexed bills are not
+        opened. Unreadable bill files are logged and skipped. Returns the
+        number of bills added.
+        """
+        n_added = 0
+        for filename in os.listdir(bill_data_dir):
+            bill_data_filename_search = bill_data_filename_regex.search(filename)
+            if not bill_data_filename_search:
+                continue
+            if bill_data_filename_search.group(3) in self.docs:
+                continue
+
+            filepath = os.path.join(bill_data_dir, filename)
+            try:
+                with open(filepath, 'r') as f:
+                    self.add_bill(json.load(f))
+            except (OSError, ValueError, KeyError):
+                logging.info("Could not index {}, skipping.".format(filepath))
+                continue
+            n_added += 1
+
+        return n_added
+
+    ##### Querying
+
+    def search(self, query: str, session: int = None, limit: int = 20) -> list:
+        """Return up to limit bill_ids matching query, best match first."""
+        return [bill_id for bill_id, score in self.search_with_scores(query, session=session, limit=limit)]
+
+    def search_with_scores(self, query: str, session: int = None, limit: int = 20) -> list:
+        """Return up to limit (bill_id, score) pairs matching query, best match
+        first. If limit is None, all matching bills are returned.
+        """
+        n_docs = len(self.docs)
+        if n_docs == 0:
+            return []
+        avg_length = self.total_length / n_docs
+
+        scores = {}
+        for gram in set(tokenize(query, unigrams=False)):
+            gram_postings = self.postings.get(gram)
+            if not gram_postings:
+                continue
+
+            idf = math.log(1 + (n_docs - len(gram_postings) + 0.5) / (len(gram_postings) + 0.5))
+            for bill_id, tf in gram_postings.items():
+                length_norm = 1 - bm25_b + bm25_b * self.docs[bill_id]['length'] / avg_length
+                scores[bill_id] = scores.get(bill_id, 0) + idf * tf * (bm25_k1 + 1) / (tf + bm25_k1 * length_norm)
+
+        if session is not None:
+            scores = {k:v for k,v in scores.items() if self.docs[k]['session'] == session}
+
+        results = sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+        return results if limit is None else results[:limit]
+
+    ##### Persistence
+
+    def save(self, filepath: str):
+        """Write the index to filepath (atomically, via a temporary file)."""
+        tmp_filepath = filepath + '.tmp'
+        with open(tmp_filepath, 'w') as f:
+            # not beautified: this file is large and not meant to be read by hand
+            json.dump({
+                'version':      bill_search_index_version,
+                'ngram_size':   ngram_size,
+                'name_weight':  name_weight,
+                'total_length': self.total_length,
+                'docs':         self.docs,
+                'postings':     self.postings,
+                }, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_filepath, filepath)
+
+    @classmethod
+    def load(cls, filepath: str) -> 'BillSearchIndex':
+        """Load an index from filepath.
+
+        Returns an empty index if the file does not exist or was built with
+        different tokenization settings.
+        """
+        index = cls()
+        if not os.path.isfile(filepath):
+            return index
+
+        with open(filepath, 'r') as f:
+            index_data = json.load(f)
+
+        if (index_data.get('version') != bill_search_index_version
+                or index_data.get('ngram_size') != ngram_size
+                or index_data.get('name_weight') != name_weight):
+            logging.info("Search index {} is outdated; it will be rebuilt.".format(filepath))
+            return index
+
+        index.total_length = index_data['total_length']
+        index.docs = index_data['docs']
+        index.postings = index_data['postings']
+        return index
+
+
+if __name__ == '__main__':
+    # Brings the index in cache_dir up to date, then runs query if given.
+    parser = argparse.ArgumentParser(description="Update and search the bill search index.")
+    parser.add_argument('--data-dir', default=default_data_dir)
+    parser.add_argument('--cache-dir', default=default_cache_dir)
+    parser.add_argument('query', nargs='*')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.cache_dir):
+        os.mkdir(args.cache_dir)
+    index_filepath = os.path.join(args.cache_dir, bill_search_index_filename)
+
+    index = BillSearchIndex.load(index_filepath)
+    n_added = index.update_from_bill_dir(os.path.join(args.data_dir, 'bills'))
+    if n_added > 0:
+        index.save(index_filepath)
+    logging.info("Added {} bills to search index ({} total).".format(n_added, len(index.docs)))
+
+    if len(args.query) > 0:
+        for bill_id, score in index.search_with_scores(' '.join(args.query)):
+            print('{}\t{:.3f}'.format(bill_id, score))
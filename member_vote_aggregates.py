@@ -0,0 +1,360 @@
+#! /usr/bin/python
+
+import logging
+logging.basicConfig(level=logging.INFO)
+
+import os
+import re
+import sys
+import json
+
+import jsbeautifier
+jsb_opts = jsbeautifier.default_options()
+jsb_opts.indent_size = 2
+
+
+# Per-member vote statistics, maintained incrementally.
+#
+# Each bill's votes are added to (or subtracted from) running totals, so only
+# bills that are new since the last update need to be read. Bill files are
+# write-once in scrape_vote_data.py, so new bills are found just by comparing
+# the bills/ directory listing with the bill ids already counted.
+#
+# Agreement with party majority depends on member_info party data, which may
+# be missing for some members when a bill is first counted. Such members are
+# recorded with the bill, and the bill is recounted once their party is known.
+# Each session also records the party each voter was counted with, so a bill
+# can be subtracted exactly as it was added; if a counted voter's party later
+# changes in member_info, the whole session is rebuilt.
+# Sessions with no member info file at all (member info is only scraped for the
+# current session) record nothing per bill, and are rebuilt if a member info
+# file for them appears.
+
+member_vote_aggregates_filename = 'member_vote_aggregates.json'
+member_vote_aggregates_version = 3
+
+bill_data_filename_regex = re.compile('bill_data_session([2-9][0-9])_no([^_]*)_id(.*).json')
+member_info_data_filename_template = 'member_info_data_session{}.json'
+
+vote_kinds = ['agree', 'oppose', 'abstain']
+
+# party value for members without a party; they have no party majority to agree with
+independent_party = '무소속'
+
+# committee key for bills with no committee (JSON object keys can't be null)
+no_committee_key = ''
+
+
+def bill_votes(bill_data: dict) -> list:
+    """Return [(member_id, name, vote_kind)] for everyone voting on a bill."""
+    return [(m['member_id'], m['name'], vote_kind)
+            for vote_kind in vote_kinds
+            for m in bill_data['members_' + vote_kind]
+            if m['member_id'] is not None]
+
+def party_majority_votes(votes: list, parties: dict) -> dict:
+    """Given [(member_id, name, vote_kind)] and {member_id: party}, return
+    {party: vote_kind} for each party with a strict plurality vote.
+    """
+    party_vote_counts = {}
+    for member_id, name, vote_kind in votes:
+        party = parties.get(member_id)
+        if party is None or party == independent_party:
+            continue
+        counts = party_vote_counts.setdefault(party, {})
+        counts[vote_kind] = counts.get(vote_kind, 0) + 1
+
+    majorities = {}
+    for party, counts in party_vote_counts.items():
+        ranked = sorted(counts.items(), key=lambda x: -x[1])
+        if len(ranked) == 1 or ranked[0][1] > ranked[1][1]:
+            majorities[party] = ranked[0][0]
+    return majorities
+
+def load_member_parties(data_dir: str, sessions: list) -> dict:
+    """Return {session: {member_id: party}} from member_info_data_session*.json.
+
+    Sessions with no member info file are left out.
+    """
+    member_parties = {}
+    for session in sessions:
+        filepath = os.path.join(data_dir, member_info_data_filename_template.format(session))
+        if os.path.isfile(filepath):
+            with open(filepath, 'r') as f:
+                member_info_data = json.load(f)
+            member_parties[session] = {k:v['party'] for k,v in member_info_data.items() if v.get('party')}
+    return member_parties
+
+
+class MemberVoteAggregates:
+    """Running per-member vote totals, by session.
+
+    Data layout (also the persisted JSON layout; session keys are strings):
+        bills:    bill_id -> {'session': session, 'vote_date': vote_date,
+                              'unresolved_member_ids': voters with no known party
+                                  (only present if there are any)}
+        sessions: session -> {
+            'has_member_info':    whether party data was available when counting
+            'counted_parties':    {member_id: party} each voter was counted with
+            'bills_by_vote_date': {vote_date: # of bills},
+            'members': member_id -> {
+                'member_id', 'name', 'party',
+                'agree', 'oppose', 'abstain', 'votes': vote counts
+                'vote_dates':  {vote_date: # of votes}
+                'party_votes': # of votes on bills where the member's party had a majority
+                'party_agree': # of those votes that agreed with the majority
+                'committees':  {committee: {'agree', 'oppose', 'abstain'}}
+                               ('' for bills with no committee)
+
+                derived by finalize():
+                'first_vote_date', 'last_vote_date'
+                'eligible_bills':  # of bills voted on between those dates
+                'attendance_rate': votes / eligible_bills
+                'party_agreement_rate': party_agree / party_votes (or None)
+                }
+            }
+    """
+
+    def __init__(self):
+        self.bills = {}
+        self.sessions = {}
+
+    ##### Updating
+
+    def add_bill(self, bill_data: dict, parties: dict):
+        """Count a bill's votes.
+
+        parties is {member_id: party} for its session, or None if the session
+        has no member info (then party agreement is not counted).
+        """
+        if bill_data['bill_id'] in self.bills:
+            raise ValueError("bill {} is already counted".format(bill_data['bill_id']))
+
+        # every bill in a session must be counted with the same party for each voter
+        counted_parties = self.sessions.get(str(bill_data['session']), {}).get('counted_parties', {})
+        for member_id, name, vote_kind in bill_votes(bill_data):
+            party = (parties or {}).get(member_id)
+            if party is not None and counted_parties.get(member_id, party) != party:
+                raise ValueError("member {} was counted with party {}, not {}".format(
+                    member_id, counted_parties[member_id], party))
+
+        unresolved_member_ids = self._apply_bill(bill_data, parties, 1)
+        bill_record = {
+            'session':   bill_data['session'],
+            'vote_date': bill_data.get('vote_date'),
+            }
+        if len(unresolved_member_ids) > 0:
+            bill_record['unresolved_member_ids'] = unresolved_member_ids
+        self.bills[bill_data['bill_id']] = bill_record
+
+    def remove_bill(self, bill_data: dict):
+        """Uncount a bill's votes, using the parties they were counted with."""
+        bill_record = self.bills.pop(bill_data['bill_id'])
+        session_aggregates = self.sessions[str(bill_data['session'])]
+        parties = None
+        if session_aggregates['has_member_info']:
+            unresolved_member_ids = set(bill_record.get('unresolved_member_ids', []))
+            parties = {k:v for k,v in session_aggregates['counted_parties'].items() if k not in unresolved_member_ids}
+        self._apply_bill(bill_data, parties, -1)
+
+    def _apply_bill(self, bill_data: dict, parties: dict, sign: int) -> list:
+        """Add (sign=1) or subtract (sign=-1) a bill's votes.
+
+        Returns the ids of voters with no known party (always empty if
+        parties is None).
+        """
+        session_aggregates = self.sessions.setdefault(str(bill_data['session']), {
+            'has_member_info':    parties is not None,
+            'counted_parties':    {},
+            'bills_by_vote_date': {},
+            'members': {},
+            })
+        has_member_info = parties is not None
+        parties = parties or {}
+        vote_date = bill_data.get('vote_date')
+        committee = bill_data.get('committee')
+        if committee is None:
+            committee = no_committee_key
+
+        # bills without a vote date don't count towards attendance
+        if vote_date is not None:
+            add_count(session_aggregates['bills_by_vote_date'], vote_date, sign)
+
+        votes = bill_votes(bill_data)
+        majorities = party_majority_votes(votes, parties)
+
+        unresolved_member_ids = []
+        for member_id, name, vote_kind in votes:
+            member_aggregates = session_aggregates['members'].setdefault(member_id, {
+                'member_id':   member_id,
+                'name':        name,
+                'party':       None,
+                'agree':       0,
+                'oppose':      0,
+                'abstain':     0,
+                'votes':       0,
+                'vote_dates':  {},
+                'party_votes': 0,
+                'party_agree': 0,
+                'committees':  {},
+                })
+
+            member_aggregates[vote_kind] += sign
+            member_aggregates['votes'] += sign
+            if vote_date is not None:
+                add_count(member_aggregates['vote_dates'], vote_date, sign)
+
+            committee_aggregates = member_aggregates['committees'].setdefault(committee, {x:0 for x in vote_kinds})
+            committee_aggregates[vote_kind] += sign
+            if not any(committee_aggregates.values()):
+                del(member_aggregates['committees'][committee])
+
+            party = parties.get(member_id)
+            if party is None:
+                if has_member_info:
+                    unresolved_member_ids.append(member_id)
+            elif sign > 0:
+                session_aggregates['counted_parties'][member_id] = party
+            if party in majorities:
+                member_aggregates['party_votes'] += sign
+                if vote_kind == majorities[party]:
+                    member_aggregates['party_agree'] += sign
+
+            if member_aggregates['votes'] == 0:
+                del(session_aggregates['members'][member_id])
+
+        return unresolved_member_ids
+
+    def update_from_bill_dir(self, bill_data_dir: str, member_parties: dict) -> int:
+        """Bring the aggregates up to date with bill_data_dir.
+
+        member_parties is {session: {member_id: party}}, without sessions that
+        have no member info. Only bills that are not yet counted, or that were
+        counted before some voter's party was known, are read. A session is
+        rebuilt from scratch if a counted bill's file has disappeared, if it
+        was counted without member info that is now available, or if a voter's
+        party differs from the one they were counted with. Returns the number
+        of bills read.
+        """
+        bill_filenames = {}
+        for filename in os.listdir(bill_data_dir):
+            bill_data_filename_search = bill_data_filename_regex.search(filename)
+            if bill_data_filename_search:
+                bill_filenames[bill_data_filename_search.group(3)] = filename
+
+        def load_bill(bill_id):
+            with open(os.path.join(bill_data_dir, bill_filenames[bill_id]), 'r') as f:
+                return json.load(f)
+
+        # rebuild any session with missing bills, or with newly available member info
+        missing_bill_ids = set(self.bills) - set(bill_filenames)
+        sessions_to_rebuild = set(self.bills[x]['session'] for x in missing_bill_ids)
+        for session, session_aggregates in self.sessions.items():
+            parties = member_parties.get(int(session))
+            if session_aggregates['has_member_info']:
+                if parties is None or any(parties.get(k) != v for k,v in session_aggregates['counted_parties'].items()):
+                    sessions_to_rebuild.add(int(session))
+            elif parties is not None:
+                sessions_to_rebuild.add(int(session))
+        for session in sessions_to_rebuild:
+            logging.info("Rebuilding member vote aggregates for session {}.".format(session))
+            self.sessions.pop(str(session), None)
+            self.bills = {k:v for k,v in self.bills.items() if v['session'] != session}
+
+        n_read = 0
+
+        # recount bills whose voters' parties have since become known
+        for bill_id, bill_record in list(self.bills.items()):
+            parties = member_parties.get(bill_record['session'])
+            if parties is not None and any(x in parties for x in bill_record.get('unresolved_member_ids', [])):
+                bill_data = load_bill(bill_id)
+                self.remove_bill(bill_data)
+                self.add_bill(bill_data, parties)
+                n_read += 1
+
+        # count new bills
+        for bill_id in set(bill_filenames) - set(self.bills):
+            bill_data = load_bill(bill_id)
+            self.add_bill(bill_data, member_parties.get(bill_data['session']))
+            n_read += 1
+
+        self.finalize(member_parties)
+        return n_read
+
+    def finalize(self, member_parties: dict):
+        """Fill in member parties and derived statistics."""
+        for session, session_aggregates in self.sessions.items():
+            parties = member_parties.get(int(session), {})
+            bills_by_vote_date = session_aggregates['bills_by_vote_date']
+
+            for member_id, member_aggregates in session_aggregates['members'].items():
+                member_aggregates['party'] = parties.get(member_id)
+
+                vote_dates = member_aggregates['vote_dates']
+                first_vote_date = min(vote_dates) if vote_dates else None
+                last_vote_date = max(vote_dates) if vote_dates else None
+                eligible_bills = sum(n for d,n in bills_by_vote_date.items()
+                                     if first_vote_date <= d <= last_vote_date) if vote_dates else 0
+
+                member_aggregates['first_vote_date'] = first_vote_date
+                member_aggregates['last_vote_date'] = last_vote_date
+                member_aggregates['eligible_bills'] = eligible_bills
+                member_aggregates['attendance_rate'] = (member_aggregates['votes'] / eligible_bills) if eligible_bills else None
+                member_aggregates['party_agreement_rate'] = (member_aggregates['party_agree'] / member_aggregates['party_votes']) if member_aggregates['party_votes'] else None
+
+    ##### Persistence
+
+    def save(self, filepath: str):
+        """Write the aggregates to filepath (atomically, via a temporary file).
+
+        The output is beautified like the other data files, with sorted keys so
+        that daily diffs only show what changed.
+        """
+        tmp_filepath = filepath + '.tmp'
+        with open(tmp_filepath, 'w') as f:
+            json_data = json.dumps({
+                'version':  member_vote_aggregates_version,
+                'bills':    self.bills,
+                'sessions': self.sessions,
+                }, ensure_ascii=False, sort_keys=True)
+            f.write(jsbeautifier.beautify(json_data, jsb_opts))
+        os.replace(tmp_filepath, filepath)
+
+    @classmethod
+    def load(cls, filepath: str) -> 'MemberVoteAggregates':
+        """Load aggregates from filepath, or return empty aggregates if the
+        file does not exist or is from an older version.
+        """
+        aggregates = cls()
+        if not os.path.isfile(filepath):
+            return aggregates
+
+        with open(filepath, 'r') as f:
+            aggregates_data = json.load(f)
+
+        if aggregates_data.get('version') != member_vote_aggregates_version:
+            logging.info("Member vote aggregates {} are outdated; they will be rebuilt.".format(filepath))
+            return aggregates
+
+        aggregates.bills = aggregates_data['bills']
+        aggregates.sessions = aggregates_data['sessions']
+        return aggregates
+
+
+def add_count(counts: dict, key, n: int):
+    """Add n to counts[key], removing the key if the count reaches 0."""
+    counts[key] = counts.get(key, 0) + n
+    if counts[key] == 0:
+        del(counts[key])
+
+
+if __name__ == '__main__':
+    # Usage: member_vote_aggregates.py [data_dir] [session ...]
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else '../data'
+    sessions = [int(x) for x in sys.argv[2:]] or [20, 21]
+    filepath = os.path.join(data_dir, member_vote_aggregates_filename)
+
+    aggregates = MemberVoteAggregates.load(filepath)
+    n_read = aggregates.update_from_bill_dir(os.path.join(data_dir, 'bills'), load_member_parties(data_dir, sessions))
+    aggregates.save(filepath)
+    logging.info("Updated member vote aggregates from {} bills ({} total).".format(n_read, len(aggregates.bills)))
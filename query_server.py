@@ -0,0 +1,442 @@
+#! /usr/bin/python
+
+import logging
+logging.basicConfig(level=logging.INFO)
+
+import os
+import re
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, unquote
+
+from bill_search_index import BillSearchIndex, bill_search_index_filename
+
+
+# Read-only JSON query service over the output of scrape_vote_data.py.
+#
+# The data dir is loaded once at startup, and in-memory indexes are built by
+# member_id, committee, vote_date, and result. The bills/ directory is
+# rescanned at most every reload_interval seconds, and only bill files that are
+# new or have changed since the last scan are (re)loaded.
+#
+# The search index is loaded from the cache dir maintained by
+# scrape_vote_data.py, and only bills missing from it (or changed since it was
+# written) are tokenized.
+
+default_data_dir = '../data'
+default_cache_dir = '../cache'
+default_host = '127.0.0.1'
+default_port = 8321
+default_reload_interval = 10 # seconds between bill dir rescans
+
+default_page_size = 50
+max_page_size = 1000
+
+bill_data_filename_regex = re.compile('bill_data_session([2-9][0-9])_no([^_]*)_id(.*).json')
+member_info_data_filename_regex = re.compile('member_info_data_session([2-9][0-9]).json')
+
+# keys dropped from bill data in list responses (they are large)
+bill_list_omit_keys = ['summary', 'members_agree', 'members_oppose', 'members_abstain']
+
+vote_kinds = ['agree', 'oppose', 'abstain']
+
+# default for query_bills filters, since None is a valid key (e.g. no committee)
+no_filter = object()
+
+
+def bill_sort_key(bill_data: dict) -> tuple:
+    """Sort key for bills: most recent vote first, then highest bill no."""
+    return (bill_data.get('vote_date') or '', str(bill_data.get('bill_no') or ''))
+
+def bill_list_item(bill_data: dict) -> dict:
+    """Return the compact form of a bill used in list responses."""
+    return {k:v for k,v in bill_data.items() if k not in bill_list_omit_keys}
+
+
+class VoteDataIndex:
+    """In-memory indexes over the bills/ directory and member info files.
+
+    Indexes:
+        bills:         bill_id -> bill data
+        member_votes:  (session, member_id) -> {bill_id: 'agree'/'oppose'/'abstain'}
+        committees:    committee -> set of bill_ids
+        vote_dates:    vote_date -> set of bill_ids
+        results:       result -> set of bill_ids
+        sessions:      session -> set of bill_ids
+        members:       session -> {member_id: member info} (from member_info_data_session*.json)
+        search:        BillSearchIndex over bill names and summaries
+
+    Member ids are not consistent across sessions, so member indexes are
+    always keyed by session as well.
+    """
+
+    def __init__(self, data_dir: str, reload_interval: float = default_reload_interval,
+                 cache_dir: str = default_cache_dir):
+        self.data_dir = data_dir
+        self.bill_data_dir = os.path.join(data_dir, 'bills')
+        self.reload_interval = reload_interval
+
+        self.lock = threading.RLock()
+        self.last_scan_time = 0
+
+        self.bill_file_mtimes = {} # filename -> mtime_ns
+        self.bill_file_ids = {}    # filename -> bill_id
+        self.member_info_file_mtimes = {} # filename -> mtime_ns
+
+        self.bills = {}
+        self.member_votes = {}
+        self.committees = {}
+        self.vote_dates = {}
+        self.results = {}
+        self.sessions = {}
+        self.members = {}
+
+        self.search_filepath = os.path.join(cache_dir, bill_search_index_filename)
+        self.search = BillSearchIndex.load(self.search_filepath)
+        self.search_mtime = os.stat(self.search_filepath).st_mtime_ns if os.path.isfile(self.search_filepath) else 0
+        n_search_docs = len(self.search.docs)
+
+        self.refresh(force=True)
+
+        # write back the search index if loading the bills added to it
+        if len(self.search.docs) != n_search_docs and os.path.isdir(cache_dir):
+            try:
+                self.search.save(self.search_filepath)
+            except OSError:
+                logging.info("Could not save search index to {}.".format(self.search_filepath))
+
+    ##### Loading
+
+    def refresh(self, force: bool = False):
+        """Rescan the data dir, loading only files that are new or changed."""
+        with self.lock:
+            curtime = time.time()
+            if (not force) and (curtime - self.last_scan_time < self.reload_interval):
+                return
+            self.last_scan_time = curtime
+
+            self._refresh_bills()
+            self._refresh_member_info()
+
+    def _refresh_bills(self):
+        if not os.path.isdir(self.bill_data_dir):
+            return
+
+        seen_filenames = set()
+        n_loaded = 0
+        for filename in os.listdir(self.bill_data_dir):
+            if not bill_data_filename_regex.search(filename):
+                continue
+            seen_filenames.add(filename)
+
+            filepath = os.path.join(self.bill_data_dir, filename)
+            try:
+                mtime = os.stat(filepath).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            if self.bill_file_mtimes.get(filename) == mtime:
+                continue
+
+            try:
+                with open(filepath, 'r') as f:
+                    bill_data = json.load(f)
+            except (OSError, ValueError):
+                # probably caught mid-write; try again next scan
+                logging.info("Could not load {}, skipping for now.".format(filepath))
+                continue
+
+            # the cached search index may be stale for files written after it
+            reindex_search = (filename in self.bill_file_ids) or (mtime > self.search_mtime)
+            if filename in self.bill_file_ids:
+                self._unindex_bill(self.bill_file_ids[filename])
+            self._index_bill(bill_data, reindex_search)
+            self.bill_file_mtimes[filename] = mtime
+            self.bill_file_ids[filename] = bill_data['bill_id']
+            n_loaded += 1
+
+        # drop bills whose files have disappeared
+        for filename in set(self.bill_file_ids) - seen_filenames:
+            self._unindex_bill(self.bill_file_ids.pop(filename))
+            self.bill_file_mtimes.pop(filename, None)
+
+        if n_loaded > 0:
+            logging.info("Loaded {} bill files ({} bills indexed).".format(n_loaded, len(self.bills)))
+
+    def _refresh_member_info(self):
+        for filename in os.listdir(self.data_dir):
+            member_info_data_filename_search = member_info_data_filename_regex.search(filename)
+            if not member_info_data_filename_search:
+                continue
+            session = int(member_info_data_filename_search.group(1))
+
+            filepath = os.path.join(self.data_dir, filename)
+            mtime = os.stat(filepath).st_mtime_ns
+            if self.member_info_file_mtimes.get(filename) == mtime:
+                continue
+
+            try:
+                with open(filepath, 'r') as f:
+                    member_info_data = json.load(f)
+            except (OSError, ValueError):
+                logging.info("Could not load {}, skipping for now.".format(filepath))
+                continue
+
+            self.members[session] = member_info_data
+            self.member_info_file_mtimes[filename] = mtime
+            logging.info("Loaded member info from {}.".format(filepath))
+
+    def _index_bill(self, bill_data: dict, reindex_search: bool = True):
+        bill_id = bill_data['bill_id']
+        self.bills[bill_id] = bill_data
+
+        session = bill_data.get('session')
+        for vote_kind in vote_kinds:
+            for member in bill_data.get('members_' + vote_kind, []):
+                if member['member_id'] is not None:
+                    self.member_votes.setdefault((session, member['member_id']), {})[bill_id] = vote_kind
+
+        self.committees.setdefault(bill_data.get('committee'), set()).add(bill_id)
+        self.vote_dates.setdefault(bill_data.get('vote_date'), set()).add(bill_id)
+        self.results.setdefault(bill_data.get('result'), set()).add(bill_id)
+        self.sessions.setdefault(bill_data.get('session'), set()).add(bill_id)
+        if reindex_search or bill_id not in self.search.docs:
+            self.search.add_bill(bill_data)
+
+    def _unindex_bill(self, bill_id: str):
+        bill_data = self.bills.pop(bill_id, None)
+        if bill_data is None:
+            return
+        self.search.remove_bill(bill_id)
+
+        session = bill_data.get('session')
+        for vote_kind in vote_kinds:
+            for member in bill_data.get('members_' + vote_kind, []):
+                member_key = (session, member['member_id'])
+                member_votes = self.member_votes.get(member_key)
+                if member_votes is not None:
+                    member_votes.pop(bill_id, None)
+                    if len(member_votes) == 0:
+                        del(self.member_votes[member_key])
+
+        for index, key in [
+                (self.committees, bill_data.get('committee')),
+                (self.vote_dates, bill_data.get('vote_date')),
+                (self.results, bill_data.get('result')),
+                (self.sessions, bill_data.get('session')),
+                ]:
+            if key in index:
+                index[key].discard(bill_id)
+                if len(index[key]) == 0:
+                    del(index[key])
+
+    ##### Queries
+
+    def query_bills(self, committee=no_filter, vote_date=no_filter, result=no_filter, session=None) -> list:
+        """Return bills matching all given filters, most recent first.
+
+        committee, vote_date, and result may be None, to match bills with no value.
+        """
+        with self.lock:
+            bill_id_sets = []
+            if committee is not no_filter:
+                bill_id_sets.append(self.committees.get(committee, set()))
+            if vote_date is not no_filter:
+                bill_id_sets.append(self.vote_dates.get(vote_date, set()))
+            if result is not no_filter:
+                bill_id_sets.append(self.results.get(result, set()))
+            if session is not None:
+                bill_id_sets.append(self.sessions.get(session, set()))
+
+            if len(bill_id_sets) == 0:
+                bill_ids = self.bills.keys()
+            else:
+                bill_ids = set.intersection(*sorted(bill_id_sets, key=len))
+
+            bills = [self.bills[x] for x in bill_ids]
+
+        bills.sort(key=bill_sort_key, reverse=True)
+        return [bill_list_item(x) for x in bills]
+
+    def query_search(self, query: str, session=None) -> list:
+        """Return all (bill_id, score) pairs matching a full-text query, best match first."""
+        with self.lock:
+            return self.search.search_with_scores(query, session=session, limit=None)
+
+    def search_result_items(self, results: list) -> list:
+        """Return list items for (bill_id, score) pairs from query_search."""
+        with self.lock:
+            return [dict(bill_list_item(self.bills[bill_id]), score=score)
+                    for bill_id, score in results if bill_id in self.bills]
+
+    def query_member_votes(self, session: int, member_id: str, vote=None) -> list:
+        """Return a member's votes in a session, most recent first."""
+        with self.lock:
+            member_votes = list(self.member_votes.get((session, member_id), {}).items())
+            bills = [(self.bills[bill_id], vote_kind) for bill_id, vote_kind in member_votes]
+
+        if vote is not None:
+            bills = [x for x in bills if x[1] == vote]
+
+        bills.sort(key=lambda x: bill_sort_key(x[0]), reverse=True)
+        return [dict(bill_list_item(b), vote=v) for b, v in bills]
+
+    def query_members(self, session=None) -> list:
+        with self.lock:
+            if session is None:
+                members = [x for session_members in self.members.values() for x in session_members.values()]
+            else:
+                members = list(self.members.get(session, {}).values())
+        members.sort(key=lambda x: (x.get('session') or 0, x.get('member_id') or ''))
+        return members
+
+    def query_member(self, session: int, member_id: str):
+        """Return a member's info in a session, or None."""
+        with self.lock:
+            return self.members.get(session, {}).get(member_id)
+
+    def key_counts(self, index_name: str) -> list:
+        """Return [{'key':..., 'count':...}] for one of the bill indexes."""
+        with self.lock:
+            index = getattr(self, index_name)
+            counts = [{'key':k, 'count':len(v)} for k,v in index.items()]
+        counts.sort(key=lambda x: (x['key'] is None, str(x['key'])))
+        return counts
+
+
+class QueryRequestHandler(BaseHTTPRequestHandler):
+    """Serve GET requests against a VoteDataIndex.
+
+    Endpoints (all list endpoints accept page and page_size):
+        /bills                     filters: committee, vote_date, result, session
+                                   (blank committee/vote_date/result: bills with none)
+        /bills/<bill_id>
+        /search                    params: q (required), session
+        /members                   filters: session
+        /members/<member_id>       params: session (required)
+        /members/<member_id>/votes params: session (required); filters: vote
+        /committees, /vote_dates, /results, /sessions
+    """
+
+    index = None # set by make_server
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k:v[-1] for k,v in parse_qs(url.query, keep_blank_values=True).items()}
+        path_parts = [unquote(x) for x in url.path.split('/') if len(x) > 0]
+
+        try:
+            self.index.refresh()
+            status, body = self.route(path_parts, params)
+        except ValueError as err:
+            status, body = 400, {'error': str(err)}
+
+        self.send_json(status, body)
+
+    def route(self, path_parts: list, params: dict) -> tuple:
+        session = int(params['session']) if 'session' in params else None
+
+        if path_parts == ['bills']:
+            # a blank filter value (e.g. committee=) matches bills with no value
+            bill_filters = {k:(params[k] or None) for k in ['committee', 'vote_date', 'result'] if k in params}
+            bills = self.index.query_bills(session=session, **bill_filters)
+            return 200, paginate(bills, params)
+
+        if path_parts == ['search']:
+            if len(params.get('q', '').strip()) == 0:
+                raise ValueError("q is required")
+            # page before building items, so only one page of bills is copied
+            search_page = paginate(self.index.query_search(params['q'], session=session), params)
+            search_page['items'] = self.index.search_result_items(search_page['items'])
+            return 200, search_page
+
+        if len(path_parts) == 2 and path_parts[0] == 'bills':
+            bill_data = self.index.bills.get(path_parts[1])
+            if bill_data is None:
+                return 404, {'error': 'bill not found'}
+            return 200, bill_data
+
+        if path_parts == ['members']:
+            return 200, paginate(self.index.query_members(session=session), params)
+
+        if path_parts[:1] == ['members'] and len(path_parts) > 1 and session is None:
+            raise ValueError("session is required (member ids differ between sessions)")
+
+        if len(path_parts) == 2 and path_parts[0] == 'members':
+            member_info = self.index.query_member(session, path_parts[1])
+            if member_info is None:
+                return 404, {'error': 'member not found'}
+            return 200, member_info
+
+        if len(path_parts) == 3 and path_parts[0] == 'members' and path_parts[2] == 'votes':
+            vote = params.get('vote')
+            if vote is not None and vote not in vote_kinds:
+                raise ValueError("vote must be one of " + ', '.join(vote_kinds))
+            votes = self.index.query_member_votes(session, path_parts[1], vote=vote)
+            return 200, paginate(votes, params)
+
+        if path_parts in [['committees'], ['vote_dates'], ['results'], ['sessions']]:
+            return 200, self.index.key_counts(path_parts[0])
+
+        return 404, {'error': 'unknown endpoint'}
+
+    def send_json(self, status: int, body):
+        json_data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(json_data)))
+        self.end_headers()
+        self.wfile.write(json_data)
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+
+def paginate(items: list, params: dict) -> dict:
+    """Return one page of items, using the page (1-based) and page_size params."""
+    page = int(params.get('page', 1))
+    page_size = int(params.get('page_size', default_page_size))
+    if page < 1:
+        raise ValueError("page must be >= 1")
+    if not (1 <= page_size <= max_page_size):
+        raise ValueError("page_size must be between 1 and {}".format(max_page_size))
+
+    start = (page - 1) * page_size
+    return {
+        'page':      page,
+        'page_size': page_size,
+        'total':     len(items),
+        'items':     items[start:start + page_size],
+        }
+
+def make_server(data_dir: str = default_data_dir, host: str = default_host, port: int = default_port,
+                reload_interval: float = default_reload_interval,
+                cache_dir: str = default_cache_dir) -> ThreadingHTTPServer:
+    """Load data_dir and return a server ready for serve_forever()."""
+    assert os.path.isdir(data_dir), "Data directory (" + data_dir + ") does not exist."
+
+    logging.info("Loading data from {}...".format(data_dir))
+    index = VoteDataIndex(data_dir, reload_interval=reload_interval, cache_dir=cache_dir)
+    logging.info("Done loading data ({} bills, {} members).".format(len(index.bills), sum(len(x) for x in index.members.values())))
+
+    handler = type('BoundQueryRequestHandler', (QueryRequestHandler,), {'index': index})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve scraped SKNA data as JSON.")
+    parser.add_argument('--data-dir', default=default_data_dir)
+    parser.add_argument('--host', default=default_host)
+    parser.add_argument('--port', type=int, default=default_port)
+    parser.add_argument('--reload-interval', type=float, default=default_reload_interval)
+    parser.add_argument('--cache-dir', default=default_cache_dir)
+    args = parser.parse_args()
+
+    server = make_server(args.data_dir, args.host, args.port, args.reload_interval, args.cache_dir)
+    logging.info("Serving on http://{}:{}/".format(args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
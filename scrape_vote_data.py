@@ -11,6 +11,8 @@ import datetime
 import time
 import json
 from assembly_scraper_methods import *
+from bill_search_index import BillSearchIndex, bill_search_index_filename
+from member_vote_aggregates import MemberVoteAggregates, member_vote_aggregates_filename, load_member_parties
 from copy import copy,deepcopy
 
 import jsbeautifier
@@ -28,10 +30,16 @@ all_sessions = [20, 21]
 current_session = 21
 
 data_dir = '../data'
+# derived data that can be rebuilt from data_dir, and is too large to commit with it
+cache_dir = '../cache'
 bad_bills_log_filename = 'bad_bills_log.json'
 
 assert os.path.isdir(data_dir), "Data directory (" + data_dir + ") does not exist. Please create it before running."
 
+# create cache dir if it doesn't exist
+if not os.path.isdir(cache_dir):
+    os.mkdir(cache_dir)
+
 bad_bills_log_filepath = os.path.join(data_dir, bad_bills_log_filename)
 # create bad bills log file if it doesn't exist
 if not os.path.isfile(bad_bills_log_filepath):
@@ -161,6 +169,23 @@ for session in all_sessions:
 
 write_data_to_json_file(bad_bills_data, bad_bills_log_filepath)
 
+##### Update bill search index
+# Only bills not yet in the index are read. The index is a cache; if it
+# doesn't exist yet it is not built here (run bill_search_index.py to build
+# it), and failures are logged rather than stopping the scrape.
+bill_search_index_filepath = os.path.join(cache_dir, bill_search_index_filename)
+if os.path.isfile(bill_search_index_filepath):
+    try:
+        bill_search_index = BillSearchIndex.load(bill_search_index_filepath)
+        n_added = bill_search_index.update_from_bill_dir(bill_data_dir)
+        if n_added > 0:
+            bill_search_index.save(bill_search_index_filepath)
+        logging.info("Added {} bills to search index.".format(n_added))
+    except Exception:
+        logging.exception("Could not update bill search index.")
+else:
+    logging.info("No bill search index at {}; skipping.".format(bill_search_index_filepath))
+
 ######################################
 
 ########## Update member data ##########
@@ -270,3 +295,15 @@ for session in member_sessions_to_dl:
         write_data_to_json_file(member_info_data, filepath)
 
 ########################################
+
+########## Update member vote aggregates ##########
+
+# Only bills saved since the last run (or whose voters' parties were unknown
+# then) are read; see member_vote_aggregates.py.
+member_vote_aggregates_filepath = os.path.join(data_dir, member_vote_aggregates_filename)
+member_vote_aggregates = MemberVoteAggregates.load(member_vote_aggregates_filepath)
+n_read = member_vote_aggregates.update_from_bill_dir(bill_data_dir, load_member_parties(data_dir, all_sessions))
+member_vote_aggregates.save(member_vote_aggregates_filepath)
+logging.info("Updated member vote aggregates from {} bills.".format(n_read))
+
+###################################################